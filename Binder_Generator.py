@@ -258,9 +258,10 @@ def generate_image_gallery(images, grid_size=(8, 4), images_per_page=32, folder_
 image_folder = select_image_folder()
 
 if image_folder:
-    # Read all image files from the selected folder
+    # Read all image files from the selected folder, skipping hidden files
+    # such as the partial downloads of a running downloader
     image_files = [os.path.join(image_folder, f) for f in os.listdir(image_folder) if
-                   os.path.isfile(os.path.join(image_folder, f))]
+                   not f.startswith('.') and os.path.isfile(os.path.join(image_folder, f))]
     image_files = list(filter(contains_number, image_files))
 
     # Sort images based on the number in the file name
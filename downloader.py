@@ -49,37 +49,155 @@ arg_parser.add_argument('-s', '--set-names', action='store_true',
 arg_parser.add_argument('-o', '--output-directory', action='store',
     dest='output_directory', metavar='dir', default='art', 
     help='Directory to store card images')
+arg_parser.add_argument('-c', '--cache-directory', action='store',
+    dest='cache_directory', metavar='dir', default=None,
+    help='Directory to cache card images and search results\n\
+Default: ~/.cache/mtg-downloader')
+arg_parser.add_argument('--no-cache', action='store_true',
+    help='Do not cache card images and search results')
+arg_parser.add_argument('-q', '--quiet', action='store_true',
+    help='Only report cards which were not saved')
+arg_parser.add_argument('-f', '--format', action='store', 
+    choices=('jpg', 'webp'), default='jpg',
+    help='Image format of card images\n\
+webp images are smaller, but are not loaded by Forge')
+arg_parser.add_argument('--durable', action='store_true',
+    help='Flush each card image to disk before it is renamed into place')
+arg_parser.add_argument('--skip-existing', action='store_true',
+    help='Do not download card images already in the output directory\n\
+Resumes an interrupted run of the same query or list;\n\
+files are matched by name, not by print')
 #arg_parser.add_argument('-h', '--help', action='help')
 #
 ###
 
 import os
-import re
-import urllib
+import shutil
+import subprocess
+import time
+import threading
+import hashlib
 import datetime
-import json
+import sys
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue
+from collections import Counter, deque
+from concurrent.futures import CancelledError, ThreadPoolExecutor, wait
 from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+import orjson  # faster JSON than the json module
 import requests
-# import urllib3  # useful for HTTP requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from PIL import Image
-from ratelimit import limits, sleep_and_retry
-# ratelimit sleep_and_retry is best used by a single thread.  conditions and
-# semaphores could be used to ensure each thread calls the decorated function
-# in turn.
 
 # Disable SSL verification warning
 # urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 #
-# get_request_limited(*args, **kwargs)
-# a rate limited wrapper of request.get()
+# logger
+# reports the progress of downloads
+#
+# records are queued by the calling thread and written to stdout by a
+# listener thread, so threads do not contend for stdout.  call
+# start_logging() to write the records.
+#
+logger = logging.getLogger('mtg-downloader')
+
+#
+# start_logging(level)
+# write log records to stdout from a listener thread
+#
+# returns  the QueueListener.  call stop() to flush the queue.
+#
+def start_logging(level=logging.INFO):
+    queue = Queue()
+    logger.addHandler(QueueHandler(queue))
+    logger.setLevel(level)
+    listener = QueueListener(queue, logging.StreamHandler(sys.stdout))
+    listener.start()
+    return  listener
+
+#
+# session
+# a persistent HTTP session shared by all requests to Scryfall
+#
+# connections to api.scryfall.com, cards.scryfall.io and the other Scryfall
+# hosts (e.g. data.scryfall.io for bulk data) are kept alive and reused by
+# the image pool.  transient server errors are retried, honoring the
+# Retry-After header of 429 Too Many Requests responses.
+#
+session = requests.Session()
+session.headers.update({
+    'User-Agent': 'mtg-downloader/1.0',
+    'Accept': 'application/json;q=0.9,*/*;q=0.8'
+})
+# one connection pool per host, each sized for the image pool.  POST is
+# retried as well; /cards/collection is a read-only lookup.
+session.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {'POST'})))
+
+#
+# cache_dir
+# directory of cached card images and search results, or None to disable
+#
+# card images are cached by their scryfall id and image URL, and linked into
+# the output directory.  search results are cached for search_ttl seconds.
+#
+cache_dir = os.path.join(os.environ.get('XDG_CACHE_HOME', 
+    os.path.join(os.path.expanduser('~'), '.cache')), 'mtg-downloader')
+search_ttl = 24 * 60 * 60  # 24 hours
+
+#
+# disable_cache(error)
+# stop using the cache directory after it could not be written
+#
+# card images and search results are then downloaded without the cache
+#
+def disable_cache(error):
+    global cache_dir
+    if cache_dir:
+        logger.warning("Cache disabled: %s", error)
+        cache_dir = None
+
+#
+# request_limited(method, *args, **kwargs)
+# a rate limited wrapper of session.request()
 #
 # call this function to limit the rate of requests to the Scryfall API
 #
-@sleep_and_retry
-@limits(calls=12, period=1)  # limit to 12 calls per second
+# each call reserves the next time slot under a lock and sleeps until then,
+# so threads calling concurrently are spaced by interval seconds in turn.
+#
+def request_limited(method, *args, **kwargs):
+    limit = request_limited
+    with limit.lock:
+        now = time.monotonic()
+        delay = limit.next_time - now
+        limit.next_time = max(now, limit.next_time) + limit.interval
+    if delay > 0:
+        time.sleep(delay)
+    return session.request(method, *args, **kwargs)
+
+# Scryfall asks for 50-100 milliseconds between requests, 10 per second
+request_limited.interval = 0.1
+request_limited.next_time = 0.0
+request_limited.lock = threading.Lock()
+
+#
+# get_request_limited(*args, **kwargs)
+# post_request_limited(*args, **kwargs)
+# rate limited wrappers of session.get() and session.post()
+#
 def get_request_limited(*args, **kwargs):
-    return requests.get(*args, **kwargs)
+    return request_limited('GET', *args, **kwargs)
+
+def post_request_limited(*args, **kwargs):
+    return request_limited('POST', *args, **kwargs)
 
 #
 # makedirs(path, exist_ok)
@@ -101,12 +219,33 @@ def get_valid_filename(name):
     # Perform substitutions
     filename = filename.replace(' // ', '')
     # Remove any characters that are not alphanumeric or accepted punctuation
-    return re.sub(r'(?u)[^-\w .;,:+\']', '', filename) # (?u) is unicode regex
+    return filename.translate(filename_table)
+
+#
+# FilenameTable
+# a str.translate() table which deletes characters that are not alphanumeric
+# or accepted punctuation
+#
+# characters are classified when first seen, so the table covers any Unicode
+# character without enumerating them
+#
+class FilenameTable(dict):
+    punctuation = frozenset("_- .;,:+'")
+
+    def __missing__(self, code):
+        char = chr(code)
+        value = code if char.isalnum() or char in self.punctuation else None
+        self[code] = value
+        return  value
+
+filename_table = FilenameTable()
 
 #
 # get_key(card, set_name)
 # generate a unique key for the card based on its set name and card name
 #
+# get_key is a KeyRegistry, which counts the keys of all threads under a lock
+#
 # append an optional numeric suffix to the filename if it already exists
 # e.g. "Mountain" -> "Mountain", "Mountain2", "Mountain3",
 #
@@ -116,25 +255,42 @@ def get_valid_filename(name):
 #  forge-core/src/main/java/forge/item/PaperCard.java
 #  forge-core/src/main/java/forge/util/ImageUtil.java : getNameToUse()
 #
-def get_key(card, set_name):
-    keys = get_key.keys
-    name = get_valid_filename(card['name'])
-    key = "{set_name}/{name}".format(set_name=set_name, name=name)
-    if not key in keys:
-        keys[key] = 1
-        return  name
-    # duplicate filename.  append a number to the name
-    keys[key] += 1
-    return  "{name}{number}".format(name=name, number=keys[key])
+# the number of prints of a card is not known until the search is complete,
+# so the first print is saved without a suffix and renamed by the caller when
+# the second print is found.
+#
+# returns  (filename, count) where count is the number of prints of the card
+#
+class KeyRegistry:
+    __slots__ = ('keys', 'lock')
+
+    def __init__(self):
+        # keys : a counter of filenames
+        #  {set name/filename -> count}
+        self.keys = Counter()
+        self.lock = threading.Lock()
+
+    def __call__(self, card, set_name):
+        name = get_valid_filename(card['name'])
+        key = set_name + '/' + name
+        with self.lock:
+            self.keys[key] += 1
+            count = self.keys[key]
+        if count == 1:
+            return  name, count
+        # duplicate filename.  append a number to the name
+        return  f"{name}{count}", count
 
-# names : a dictionary of filenames
-#  {filename -> count} 
-get_key.keys = dict()
+get_key = KeyRegistry()
 
 #
 # rename_file(old_name, new_name[, dir_path])
 # rename a file in the specified directory
 #
+# an existing file named new_name is replaced
+#
+# returns  the new file path or None if the file was not renamed
+#
 def rename_file(old_name, new_name, dir_path=None):
     old_file = old_name
     new_file = new_name
@@ -143,11 +299,10 @@ def rename_file(old_name, new_name, dir_path=None):
         old_file = os.path.join(dir_path, old_name)
         new_file = os.path.join(dir_path, new_name)
     try:
-        if os.path.isfile(old_file):
-            os.rename(old_file, new_file)
-            return  new_file  # the new file path
-        else:
-            return  None      # old file not found
+        os.replace(old_file, new_file)
+        return  new_file  # the new file path
+    except FileNotFoundError:
+        return  None      # old file not found
     except OSError as e:
         # no error handling, just return None
         return  None
@@ -159,12 +314,455 @@ def rename_file(old_name, new_name, dir_path=None):
 # if the file already exists, overwrite it
 # downloads from scryfall.io are not rate limited
 #
+# the response body is streamed to a temporary file in blocks, which replaces
+# file_path when the download is complete.  an interrupted download does not
+# leave a partial file at file_path.
+#
+# returns  the size of the file
+#
 def write_file(url, file_path):
-    with open(file_path, 'wb') as file:
-        if not url:
+    if not url:
+        with open(file_path, 'wb') as file:
             return  0 # only truncate file
-        req = requests.get(url)
-        return  file.write(req.content)
+    # threads may download the same file
+    part_path = get_part_path(file_path)
+    try:
+        with open(part_path, 'wb') as file:
+            with session.get(url, stream=True, timeout=30,
+                             headers={'Accept-Encoding': 'identity'}) as req:
+                req.raise_for_status()
+                shutil.copyfileobj(req.raw, file, 
+                    get_block_size(os.path.dirname(file_path)))
+            size = file.tell()
+        sync_file(part_path)
+        os.replace(part_path, file_path)
+    except BaseException:
+        if os.path.isfile(part_path):
+            os.remove(part_path)
+        raise
+    return  size
+
+#
+# get_part_path(file_path)
+# get the path of a temporary file which is renamed to file_path when complete
+#
+# partial files are hidden and named by the process and thread which write
+# them, e.g.
+#  Mountain.full.jpg -> .Mountain.full.jpg.4711-140245.part
+#
+def get_part_path(file_path):
+    (dir_path, name) = os.path.split(file_path)
+    return  os.path.join(dir_path, 
+        f".{name}.{os.getpid()}-{threading.get_ident()}.part")
+
+#
+# is_stale_part(file_path)
+# check if a partial file was left by a process which is no longer running
+#
+# where a process cannot be looked up (Windows), a partial file is stale when
+# it was not modified for an hour.  a download times out long before.
+#
+# returns  True if the partial file can be removed
+#
+def is_stale_part(file_path):
+    try:
+        pid = int(file_path.rsplit('.', 2)[-2].split('-')[0])
+    except ValueError:
+        return  False  # not a partial file of this program
+    if pid == os.getpid():
+        return  False
+    if os.name == 'posix':
+        try:
+            os.kill(pid, 0)  # signal 0 only checks that the process exists
+        except ProcessLookupError:
+            return  True
+        except OSError:
+            pass  # the process runs as another user
+        return  False
+    try:
+        return  time.time() - os.path.getmtime(file_path) > 3600
+    except OSError:
+        return  False
+
+#
+# sync_file(file_path)
+# flush a partial file to disk before it is renamed into place
+#
+# the file is opened for writing, as Windows does not flush read-only files.
+# if durable is False, the file is left to the OS to write.  a crash may then
+# leave an empty or partial card image under the final name.
+#
+def sync_file(file_path):
+    if not durable:
+        return
+    with open(file_path, 'r+b') as file:
+        os.fsync(file.fileno())
+
+# durable : flush card images to disk before they are renamed into place
+#  (write_file, link_file, save_image, rotate_image)
+durable = False
+# drop_cache : advise the OS not to cache flushed card images (where supported)
+drop_cache = hasattr(os, 'posix_fadvise')
+
+#
+# get_block_size(dir_path)
+# get the size of the blocks in which downloads are written to a directory
+#
+# returns  at least 64 KiB, rounded up to a multiple of the file system block
+#          size
+#
+@lru_cache(256)
+def get_block_size(dir_path):
+    block_size = 64 * 1024
+    try:
+        fs_block_size = os.statvfs(dir_path or '.').f_bsize
+    except (AttributeError, OSError):
+        return  block_size  # statvfs is not available on Windows
+    if fs_block_size <= 0:
+        return  block_size
+    return  -(-block_size // fs_block_size) * fs_block_size
+
+#
+# link_file(src_path, dst_path)
+# link a file to a new path, or copy it if links are not supported
+#
+# if the destination already exists, replace it.  the link or copy is made
+# at a partial file which is renamed to dst_path when complete.
+#
+def link_file(src_path, dst_path):
+    part_path = get_part_path(dst_path)
+    try:
+        try:
+            os.link(src_path, part_path)
+        except OSError:
+            # cross-device link or unsupported by the file system
+            shutil.copyfile(src_path, part_path)
+            sync_file(part_path)
+        os.replace(part_path, dst_path)
+        if os.path.isfile(part_path):
+            # dst_path was already a link to src_path; rename does nothing
+            os.remove(part_path)
+    except BaseException:
+        if os.path.isfile(part_path):
+            os.remove(part_path)
+        raise
+    return  os.path.getsize(dst_path)
+
+#
+# save_image(image, file_path)
+# save an image to a file in the image format
+#
+# the image is saved to a partial file which replaces file_path when complete
+#
+def save_image(image, file_path):
+    (pil_format, options) = image_formats[image_format]
+    part_path = get_part_path(file_path)
+    try:
+        image.save(part_path, pil_format, **options)
+        sync_file(part_path)
+        os.replace(part_path, file_path)
+    except BaseException:
+        if os.path.isfile(part_path):
+            os.remove(part_path)
+        raise
+
+# image_formats : a dictionary of PIL formats and options for saving images
+#  {image format -> (PIL format, options)}
+image_formats = {
+    'jpg': ('JPEG', {}),
+    'webp': ('WEBP', {'quality': 85, 'method': 4})
+}
+# image_format : the format of card images in the output directory
+#  Scryfall images are JPEG.  Forge only loads .jpg card images.
+image_format = 'jpg'
+
+#
+# get_cache_path(url, cache_name)
+# get the path of a card image in the cache directory
+#
+# Scryfall replaces low resolution and preview scans under the same card id,
+# changing the ?<timestamp> query of the image URL.  the cached image is named
+# by a digest of the full URL, so a replaced scan is downloaded again.
+#
+# returns  the path or None if the cache directory cannot be created
+#
+def get_cache_path(url, cache_name):
+    images_dir = os.path.join(cache_dir, 'images')
+    try:
+        makedirs(images_dir)
+    except OSError as e:
+        disable_cache(e)
+        return  None
+    version = hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]
+    return  os.path.join(images_dir, f"{cache_name}-{version}.jpg")
+
+#
+# save_file(url, file_path[, flip_path, cache_name])
+# download a card image and save it to a file
+#
+# if flip_path is provided, a copy rotated 180 degrees is saved to flip_path
+# if cache_name is provided, the image is stored in the cache directory and
+# linked to file_path.  cached images are not downloaded again.
+# if the image format is not jpg, the downloaded image is converted.
+# if skip_existing is True, images saved by a previous run are not saved again
+#
+# returns  the size of the file
+#
+def save_file(url, file_path, flip_path=None, cache_name=None):
+    if skip_existing and is_saved(file_path) and \
+       (not flip_path or is_saved(flip_path)):
+        return  get_file_size(file_path)  # the card image is already saved
+    temp_path = None
+    jpeg_path = None
+    if cache_dir and cache_name:
+        jpeg_path = get_cache_path(url, cache_name)
+        if jpeg_path and not os.path.isfile(jpeg_path):
+            try:
+                write_file(url, jpeg_path)
+            except requests.RequestException:
+                raise  # the download failed
+            except OSError as e:
+                # the cache is not writable.  save the image directly
+                disable_cache(e)
+                jpeg_path = None
+    if jpeg_path:
+        pass  # the image is cached
+    elif image_format == 'jpg':
+        jpeg_path = file_path
+        write_file(url, jpeg_path)
+    else:
+        # download to a temporary file for conversion
+        jpeg_path = temp_path = get_part_path(file_path + ".jpg")
+        write_file(url, jpeg_path)
+
+    try:
+        if image_format == 'jpg':
+            if jpeg_path != file_path:
+                link_file(jpeg_path, file_path)
+        else:
+            with Image.open(jpeg_path) as image:
+                save_image(image, file_path)
+        if flip_path:
+            rotate_image(jpeg_path, flip_path)
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+    if durable:
+        # the files were flushed by sync_file and are not read again.  a jpg
+        # file_path is jpeg_path or a link to it
+        if image_format != 'jpg':
+            drop_file_cache(file_path)
+        if jpeg_path != temp_path:
+            drop_file_cache(jpeg_path)
+        if flip_path:
+            drop_file_cache(flip_path)
+    return  os.path.getsize(file_path)
+
+#
+# drop_file_cache(file_path)
+# advise the OS not to keep a file in its page cache
+#
+# POSIX_FADV_DONTNEED only releases the clean pages of a file.  the pages of
+# a file which was just written are dirty until the OS writes them to disk,
+# so the advice is only useful after the file is flushed with --durable.
+# the advice is only a hint, so errors are ignored.
+#
+def drop_file_cache(file_path):
+    if not drop_cache:
+        return
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+#
+# rotate_image(jpeg_path, flip_path)
+# save a copy of a JPEG image rotated 180 degrees
+#
+# jpegtran rotates JPEG images losslessly, without decoding and encoding the
+# image.  an image with a partial MCU block at an edge cannot be rotated
+# losslessly, so jpegtran is run with -perfect and fails on it, rather than
+# trimming the edge.  the rotated image always has the size of the original.
+# Scryfall's 672x936 4:2:0 large images have partial blocks.
+# if jpegtran is not installed or fails, or the image format is not jpg, the
+# image is rotated by PIL.
+#
+# images are rotated by the threads of the image pool.  jpegtran runs in its
+# own process, and PIL releases the GIL while it decodes and encodes, so
+# rotations run in parallel with the other downloads.
+#
+def rotate_image(jpeg_path, flip_path):
+    if jpegtran and image_format == 'jpg':
+        part_path = get_part_path(flip_path)
+        result = subprocess.run([jpegtran, '-perfect', '-rotate', '180', 
+                                 '-copy', 'all', '-outfile', part_path, 
+                                 jpeg_path], 
+                                stdout=subprocess.DEVNULL, 
+                                stderr=subprocess.DEVNULL)
+        try:
+            if result.returncode == 0:
+                sync_file(part_path)
+                os.replace(part_path, flip_path)
+                return
+        finally:
+            if os.path.isfile(part_path):
+                os.remove(part_path)
+    with Image.open(jpeg_path) as image:
+        pixels = image.transpose(Image.Transpose.ROTATE_180)
+        save_image(pixels, flip_path)
+        pixels.close()
+
+# jpegtran : the path of the jpegtran command or None if it is not installed
+jpegtran = shutil.which('jpegtran')
+
+# skip_existing : do not download card images which are already saved
+#  card images are written to partial files and renamed into place when
+#  complete (write_file, link_file, save_image), so an existing file which is
+#  not empty is a complete image.
+#  files are matched by name only.  duplicate names are numbered in the order
+#  the prints are found (Name, Name1, ...), so a different query or list run
+#  into the same directory may find another print under the name.  skipping
+#  is off unless requested with --skip-existing.
+skip_existing = False
+
+#
+# is_saved(file_path)
+# check if a card image was saved by a previous run
+#
+# the files of a set directory are listed when the directory is initialized,
+# so card images which are not in the listing are not checked with a stat
+#
+# returns  True if the file exists and is not empty
+#
+def is_saved(file_path):
+    (dir_path, name) = os.path.split(file_path)
+    listing = dir_listings.get(dir_path)
+    if listing is not None and name not in listing:
+        return  False
+    return  get_file_size(file_path) > 0
+
+# dir_listings : the names of the files in set directories
+#  {dir_path -> frozenset of filenames} 
+dir_listings = dict()
+
+#
+# get_file_size(file_path)
+# get the size of a file
+#
+# returns  the size of the file or 0 if the file does not exist
+#
+def get_file_size(file_path):
+    try:
+        return  os.stat(file_path).st_size
+    except OSError:
+        return  0
+
+#
+# image_pool
+# a pool of threads which download card images concurrently
+#
+# downloads from scryfall.io are not rate limited.  the number of workers
+# bounds the concurrent connections to scryfall.io to remain polite.
+#
+image_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='download')
+
+# pending_files : a dictionary of downloads in progress
+#  {file_path -> Future}
+pending_files = dict()
+# pending : downloads submitted by the current thread
+#  pending.cards : a queue of card downloads in the order they were submitted
+#   [(label, [Future, ...]), ...]
+#  pending.renames : files to rename once their downloads are complete
+#   [(file_path, new_path), ...]
+pending = threading.local()
+
+#
+# get_pending_cards()
+# get the queue of card downloads submitted by the current thread
+#
+def get_pending_cards():
+    if not hasattr(pending, 'cards'):
+        pending.cards = deque()
+    return  pending.cards
+
+#
+# get_pending_renames()
+# get the list of renames queued by the current thread
+#
+def get_pending_renames():
+    if not hasattr(pending, 'renames'):
+        pending.renames = []
+    return  pending.renames
+
+#
+# download_file(url, file_path[, flip_path, cache_name])
+# submit a download of a card image to the image pool
+#
+# see save_file() for the optional parameters
+#
+# returns a Future of the download
+#
+def download_file(url, file_path, flip_path=None, cache_name=None):
+    future = image_pool.submit(save_file, url, file_path, flip_path, 
+                               cache_name)
+    paths = (file_path, flip_path) if flip_path else (file_path,)
+    for path in paths:
+        pending_files[path] = future
+    # forget the download when it is complete
+    future.add_done_callback(
+        lambda future: [pending_files.pop(path, None) for path in paths])
+    return  future
+
+#
+# cancel_downloads()
+# cancel the downloads which have not started when the process is interrupted
+#
+# the image and search pools are shut down, so no downloads may be submitted
+# afterwards.  otherwise the queued downloads would run before the process
+# exits.  downloads in progress are completed.
+#
+def cancel_downloads():
+    image_pool.shutdown(wait=False, cancel_futures=True)
+    search_pool.shutdown(wait=False, cancel_futures=True)
+    get_pending_cards().clear()
+    pending_files.clear()
+
+#
+# finish_downloads(block=True)
+# report card downloads which have completed in the order they were submitted
+#
+# if block is False, stop at the first card with a download in progress
+#
+# returns  (saved, not_saved) counts of cards
+#
+def finish_downloads(block=True):
+    saved = 0
+    not_saved = 0
+    pending_cards = get_pending_cards()
+    while pending_cards:
+        label, futures = pending_cards[0]
+        if not block and not all(future.done() for future in futures):
+            break
+        pending_cards.popleft()
+        errors = [future.exception() for future in futures 
+                  if future.exception()]
+        if errors:
+            logger.warning("Failed to save %s: %s", label, errors[0])
+            not_saved += 1
+        else:
+            logger.info(" saved %s", label)
+            saved += 1
+    return  saved, not_saved
+
+#
+# search_pool
+# a thread which prefetches the next page of search results
+#
+search_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search')
 
 #
 # find_set(set_code)
@@ -172,19 +770,111 @@ def write_file(url, file_path):
 #
 # returns a set or None
 #
+# sets are cached for the life of the process to avoid redundant, rate
+# limited requests.  only found sets and unknown set codes (404) are cached,
+# so a set is looked up again after a transient error.
+#
 def find_set(set_code):
+    if set_code in find_set.sets:
+        return  find_set.sets[set_code]
     url = f"https://api.scryfall.com/sets/{set_code}"
     try:
-        response = get_request_limited(url)
+        response = get_request_limited(url, timeout=30)
 
         if response.status_code == 200:
-            body = response.json()
+            body = orjson.loads(response.content)
+            find_set.sets[set_code] = body
             return body
+        elif response.status_code == 404:
+            find_set.sets[set_code] = None
+            return None
         else:
             return None
     except Exception as e: # JSONDecodeError
         return None
 
+# find_set.sets : sets found by code, or None for unknown set codes
+#  {set code -> set}
+find_set.sets = dict()
+
+#
+# search_cards(uri[, params])
+# fetch a page of card search results from the Scryfall API
+#
+# params is an optional dict of query parameters.  the next_page URI of a
+# page of results includes its parameters.
+#
+# pages are cached in the cache directory for search_ttl seconds
+#
+# returns  a page of search results or None if no cards were found
+#
+def search_cards(uri, params=None):
+    cache_path = None
+    if cache_dir:
+        # cache pages by the URL which requests will send
+        url = requests.Request('GET', uri, params=params).prepare().url
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        cache_path = os.path.join(cache_dir, 'search', f"{digest}.json")
+        try:
+            if time.time() - os.path.getmtime(cache_path) < search_ttl:
+                with open(cache_path, 'rb') as file:
+                    return  orjson.loads(file.read())
+        except (OSError, ValueError):
+            pass  # search results are not cached
+
+    response = get_request_limited(uri, params=params, timeout=30)
+    if response.status_code == 404:
+        return  None  # no results found
+    if response.status_code != 200:
+        raise Exception(f"Request to scryfall failed: \
+{response.status_code} {response.reason}")
+    res = orjson.loads(response.content)
+
+    if cache_path:
+        # replace the cached page atomically; readers never see partial JSON
+        part_path = get_part_path(cache_path)
+        try:
+            makedirs(os.path.dirname(cache_path))
+            with open(part_path, 'wb') as file:
+                file.write(response.content)
+            os.replace(part_path, cache_path)
+        except OSError:
+            if os.path.isfile(part_path):
+                os.remove(part_path)
+    return  res
+
+#
+# search_pages(uri[, params])
+# produce the pages of card search results from the Scryfall API
+#
+# the first page is not prefetched, so a query declined at the confirmation
+# prompt makes no further requests.  from the second page, the next page is
+# fetched by the search pool while the caller consumes the current page, so
+# searches overlap the downloads of card images
+#
+# yields  pages of search results; nothing if no cards were found
+#
+def search_pages(uri, params=None):
+    res = search_cards(uri, params)
+    next_page = None
+    try:
+        while res:
+            yield res
+            # the caller has consumed the page.  get the next page, and
+            # prefetch the page after it while the next page is consumed
+            if next_page:
+                res = next_page.result()
+            elif res['has_more'] and res['next_page']:
+                res = search_cards(res['next_page'])
+            else:
+                res = None
+            next_page = None
+            if res and res['has_more'] and res['next_page']:
+                next_page = search_pool.submit(search_cards, res['next_page'])
+    finally:
+        if next_page:
+            next_page.cancel()  # the consumer stopped early
+
 #
 # get_all_cards_url()
 # get the URL for bulk data containing all Magic: The Gathering cards
@@ -193,9 +883,13 @@ def find_set(set_code):
 #
 # returns  URL for the JSON of all MTG cards
 #
+# the bulk data catalog is updated daily, so the URL is cached for the life
+# of the process
+#
+@lru_cache(1)
 def get_all_cards_url():
-    res = get_request_limited('https://api.scryfall.com/bulk-data')
-    content = res.json()
+    res = get_request_limited('https://api.scryfall.com/bulk-data', timeout=30)
+    content = orjson.loads(res.content)
     # response contains URIs for card images, JSON, sets, etc.
     all_cards_uri = None
     for bulk_data in content['data']:
@@ -213,12 +907,13 @@ def get_all_cards_url():
 #  "name:Mountain set:inv"
 #  {"name": "Mountain", "set": "inv"}
 # confirm is a boolean; if True, confirm query results before downloading
+# found is an optional list; the names of the cards found are appended
 #
 # apply a rate limit to API requests in this function
-# use asynchronous IO to download card json and images faster
+# card images are downloaded concurrently by the image pool
 #
 def get_card_data_and_download(output_dir, query_parts, confirm=False, 
-                               use_set_names=False):
+                               use_set_names=False, found=None):
     if not isinstance(query_parts, str):
         # query_parts is a dict
         query = ' '.join(f'{key}:{val}' for key, val in query_parts.items())
@@ -233,26 +928,18 @@ def get_card_data_and_download(output_dir, query_parts, confirm=False,
         "include_variations": "true",
         "format": "json"  # content format
     }
-    uri = "https://api.scryfall.com/cards/search?" + urllib.parse.urlencode(params)
+    uri = "https://api.scryfall.com/cards/search"
 
+    saved = 0
+    not_saved = 0
+    queued = 0
     try:
-        saved = 0
-        not_saved = 0
-
         # query results are paginated
-        while uri:
-            response = get_request_limited(uri)
-            if response.status_code == 404:
-                break  # no results found
-            if response.status_code != 200:
-                raise Exception(f"Request to scryfall failed: \
-{response.status_code} {response.reason}")
-            
-            res = response.json()
+        for res in search_pages(uri, params):
             if res['total_cards'] == 0:
                 return 0, 0  # no cards found
             
-            if confirm and saved + not_saved == 0:
+            if confirm and queued + not_saved == 0:
                 # confirm the first 10 cards before downloading
                 item = 0
                 if res['total_cards'] == 1:
@@ -269,114 +956,436 @@ def get_card_data_and_download(output_dir, query_parts, confirm=False,
                     print(' {set_name}:{name}'.format(set_name=set_name,
                                                       name=card['name']))
                     item += 1
+                # download the first page while the user reads the list
+                prefetch = prefetch_images(res["data"])
                 reply = input('Is this correct? ').strip()
                 if reply in ('n', 'N', 'no', 'NO'):
+                    for future in prefetch:
+                        future.cancel()
                     not_saved += res['total_cards']
                     break
+                # cached images are linked when the cards are saved
+                wait(prefetch)
 
-            for card in res["data"]:
-                # save the card image
-                # no additional rate limits are required.  save_card_image()
-                # makes download requests to scryfall.io
-                (stored, not_stored) = save_card_image(output_dir, card, 
-                                                       use_set_names)
-                if stored > 0:
-                    saved += stored
-                if not_stored > 0:
+            if found is not None:
+                found.extend(card['name'] for card in res["data"])
+            # cards of a set are usually consecutive in the results.  resolve
+            # the set directory once for each run of cards
+            for set_key, cards in groupby(res["data"], 
+                    key=itemgetter('set_name' if use_set_names else 'set')):
+                (set_name, dir_path) = get_set_directory(output_dir, 
+                    set_key if use_set_names else set_key.upper())
+                for card in cards:
+                    # save the card image
+                    # no additional rate limits are required.  save_card_image()
+                    # submits download requests to scryfall.io
+                    (stored, not_stored) = save_set_card_image(set_name, 
+                                                               dir_path, card)
+                    queued += stored
                     not_saved += not_stored
-        
-            if res['has_more'] and res['next_page']:
-                uri = res['next_page']
+
+            # report downloads completed while the page was processed
+            (stored, not_stored) = finish_downloads(block=False)
+            saved += stored
+            not_saved += not_stored
+    except Exception as e:
+        logger.error(str(e))
+    except BaseException:
+        cancel_downloads()  # interrupted, e.g. Ctrl-C
+        raise
+
+    # wait for the remaining card images
+    try:
+        (stored, not_stored) = finish_downloads()
+    except BaseException:
+        cancel_downloads()
+        raise
+    saved += stored
+    not_saved += not_stored
+    return saved, not_saved
+
+#
+# get_collection_and_download(output_dir, entries, use_set_names)
+# collect a batch of cards from the Scryfall API and download the card images
+#
+# entries is a list of up to 75 (entry, parameters) from a list of cards.
+# each entry must select a card by set code and card number:
+#  ("Mountain [ltr] 300", {"name": "Mountain", "set": "ltr", "number": "300"})
+#
+# the cards are fetched with one request to the collection endpoint
+#  https://scryfall.com/docs/api/cards/collection
+#
+def get_collection_and_download(output_dir, entries, use_set_names=False):
+    saved = 0
+    not_saved = 0
+
+    # match cards to entries by set code and card number
+    matches = dict()
+    for entry, parameters in entries:
+        key = (parameters['set'].lower(), parameters['number'].lower())
+        matches.setdefault(key, deque()).append((entry, parameters))
+    identifiers = [{'set': parameters['set'], 
+                    'collector_number': parameters['number']}
+                   for entry, parameters in entries]
+
+    try:
+        response = post_request_limited(
+            "https://api.scryfall.com/cards/collection",
+            data=orjson.dumps({'identifiers': identifiers}), 
+            headers={'Content-Type': 'application/json'}, timeout=30)
+        if response.status_code != 200:
+            raise Exception(f"Request to scryfall failed: \
+{response.status_code} {response.reason}")
+
+        res = orjson.loads(response.content)
+        for card in res['data']:
+            key = (card['set'], card['collector_number'].lower())
+            # the collection is not filtered by name.  match the first entry
+            # whose name matches the card
+            for entry, parameters in matches.get(key, ()):
+                if 'name' not in parameters or \
+                   parameters['name'].lower() in card['name'].lower():
+                    break
             else:
-                uri = None
+                continue  # no entry selects this card
+            matches[key].remove((entry, parameters))
+            (stored, not_stored) = save_card_image(output_dir, card, 
+                                                   use_set_names)
+            not_saved += not_stored
     except Exception as e:
-        print(str(e))
+        logger.error(str(e))
 
+    # entries not found in the collection
+    for unmatched in matches.values():
+        for entry, parameters in unmatched:
+            logger.warning("No cards match: %s", entry)
+            not_saved += 1
+
+    # wait for the card images
+    (stored, not_stored) = finish_downloads()
+    saved += stored
+    not_saved += not_stored
     return saved, not_saved
 
+#
+# get_set_directory(output_dir, set_name)
+# initialize the output directory for a set of cards
+#
+# the directory is created and listed once per set rather than once per card
+#
+# partial files of an interrupted run are removed from the directory
+#
+# returns  (set_name, dir_path) with a set name valid for the file system
+#
+@lru_cache(256)
+def get_set_directory(output_dir, set_name):
+    set_name = get_valid_filename(set_name)
+    dir_path = os.path.join(output_dir, set_name)
+    os.makedirs(dir_path, exist_ok=True)
+    listing = set(os.listdir(dir_path))
+    # remove partial files left by an interrupted run.  partial files of a
+    # running process are kept
+    for name in [name for name in listing 
+                 if name.startswith('.') and name.endswith('.part')]:
+        part_path = os.path.join(dir_path, name)
+        if is_stale_part(part_path):
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass  # removed by another process
+        listing.discard(name)
+    if skip_existing:
+        # list the card images saved by previous runs
+        dir_listings[dir_path] = frozenset(listing)
+    return  set_name, dir_path
+
+#
+# get_filename(card, set_name, dir_path[, alt])
+# get a unique filename for a card image and queue the rename of a previous
+# file if necessary
+#
+# alt is appended to the card name, e.g. the name of the second face
+#
+def get_filename(card, set_name, dir_path, alt=None):
+    if alt:
+        prev_name = card['name']
+        card['name'] += alt
+    (key, count) = get_key(card, set_name)
+    if alt:
+        card['name'] = prev_name
+    suffix = '.full.' + image_format
+    prefix = dir_path + os.sep
+    if count == 2:
+        # rename previous file -> file1 when its download is complete.  the
+        # rename is queued for save_set_card_image()
+        original = prefix + key[:-1]  # remove the last character, a number
+        get_pending_renames().append((original + suffix, 
+                                      original + '1' + suffix))
+    return  prefix + key + suffix
+
+#
+# get_cache_name(card[, face])
+# card images are cached by scryfall id.  faces are numbered.
+#
+# see get_cache_path() for the version of the image
+#
+def get_cache_name(card, face=None):
+    if 'id' not in card:
+        return  None
+    if face is None:
+        return  card['id']
+    return  f"{card['id']}-{face}"
+
+#
+# get_image_layout(card)
+# classify a card by the images which represent it
+#
+# returns  a key of image_planners or None if the card has no image
+#
+def get_image_layout(card):
+    if 'card_faces' in card and len(card['card_faces']) > 0:
+        layout = card.get('layout')
+        if layout in ('adventure', 'split', 'flip', 'reversible_card'):
+            return  layout
+        # transform layout cards have two card images
+        return  'faces'
+    if 'image_uris' in card:
+        return  'single'
+    return  None
+
+#
+# plan_*_image(card, set_name, dir_path)
+# plan the downloads of the card images for a layout of card
+#
+# filenames are assigned and renames of previous files are queued, but
+# nothing is downloaded.
+#
+# returns  a list of (url, file_path, flip_path, cache_name) for download_file()
+#
+def plan_single_image(card, set_name, dir_path):
+    return  [(card['image_uris']['large'], 
+              get_filename(card, set_name, dir_path), 
+              None, get_cache_name(card))]
+
+def plan_adventure_image(card, set_name, dir_path):
+    # adventure cards have an alternate name: card_faces[0]
+    return  [(card['image_uris']['large'], 
+              get_filename(card['card_faces'][0], set_name, dir_path),
+              None, get_cache_name(card))]
+
+def plan_split_image(card, set_name, dir_path):
+    # split cards have an alternate name: face[0] + face[1]
+    return  [(card['image_uris']['large'], 
+              get_filename(card['card_faces'][0], set_name, dir_path, 
+                           card['card_faces'][1]['name']),
+              None, get_cache_name(card))]
+
+def plan_flip_image(card, set_name, dir_path):
+    # flip cards are two images: faces[0], flip(faces[1])
+    file_0 = get_filename(card['card_faces'][0], set_name, dir_path)
+    return  [(card['image_uris']['large'], file_0,
+              get_filename(card['card_faces'][1], set_name, dir_path),
+              get_cache_name(card))]
+
+def plan_reversible_image(card, set_name, dir_path):
+    # reversibles are not coded in Forge card rules, thus there is no
+    # back loaded for this card.  store the back with -bk postfix.
+    return  [(card['card_faces'][0]['image_uris']['large'],
+              get_filename(card['card_faces'][0], set_name, dir_path), 
+              None, get_cache_name(card, 0)),
+             (card['card_faces'][1]['image_uris']['large'],
+              get_filename(card['card_faces'][1], set_name, dir_path, "-bk"),
+              None, get_cache_name(card, 1))]
+
+def plan_face_images(card, set_name, dir_path):
+    return  [(card_face['image_uris']['large'], 
+              get_filename(card_face, set_name, dir_path),
+              None, get_cache_name(card, face))
+             for face, card_face in enumerate(card['card_faces'])]
+
+# image_planners : a dictionary of functions which plan the images of a card
+#  {image layout -> plan_*_image}
+image_planners = {
+    'single': plan_single_image,
+    'adventure': plan_adventure_image,
+    'split': plan_split_image,
+    'flip': plan_flip_image,
+    'reversible_card': plan_reversible_image,
+    'faces': plan_face_images
+}
+
+#
+# plan_card_image(card, set_name, dir_path)
+# plan the downloads of the card images
+#
+# returns  a list of (url, file_path, flip_path, cache_name) or None if the
+#          card has no image
+#
+def plan_card_image(card, set_name, dir_path):
+    plan_images = image_planners.get(get_image_layout(card))
+    if not plan_images:
+        return  None
+    return  plan_images(card, set_name, dir_path)
+
+#
+# prefetch_images(cards)
+# download card images to the cache directory before they are saved
+#
+# output filenames are not assigned, so the prefetch may be cancelled without
+# affecting the output directory.  save_file() links the cached images.
+#
+# returns  a list of Futures of the downloads
+#
+def prefetch_images(cards):
+    if not cache_dir:
+        return  []
+    futures = []
+    for card in cards:
+        layout = get_image_layout(card)
+        if layout in ('reversible_card', 'faces'):
+            images = [(card_face['image_uris']['large'], 
+                       get_cache_name(card, face))
+                      for face, card_face in enumerate(card['card_faces'])]
+        elif layout:
+            images = [(card['image_uris']['large'], get_cache_name(card))]
+        else:
+            continue  # no image
+        for url, cache_name in images:
+            if not cache_name:
+                continue
+            jpeg_path = get_cache_path(url, cache_name)
+            if not jpeg_path:
+                return  futures  # the cache is disabled
+            if not os.path.isfile(jpeg_path):
+                futures.append(image_pool.submit(write_file, url, jpeg_path))
+    return  futures
+
 #
 # save_card_image(output_dir, card, use_set_names=False)
 # download the card image and store with a unique filename
 #
+# downloads are submitted to the image pool.  call finish_downloads() to wait
+# for the card images to be saved.
+#
+# returns  (submitted, not_saved) counts of cards
+#
 def save_card_image(output_dir, card, use_set_names=False):
-    set_name = get_valid_filename(card['set'].upper())
-    if use_set_names:
-        set_name = get_valid_filename(card['set_name'])
-    # initialize output directory for set
-    dir_path = os.path.join(output_dir, set_name)
-    makedirs(dir_path)
-
-    # get a unique filename and rename previous files if necessary
-    def get_filename(card, alt=None):
-        if alt:
-            prev_name = card['name']
-            card['name'] += alt
-        key = get_key(card, set_name)
-        if alt:
-            card['name'] = prev_name
-        # check number at end of key
-        match = re.search(r'[0-9]{1,}$', key)
-        if match and int(match[0]) == 2:
-            # rename previous file -> file1
-            original = key[:-1]  # remove the last character, a number
-            rename_file("{0}.full.jpg".format(original), 
-                "{base}1.full.jpg".format(base=original), dir_path)
-        return  os.path.join(dir_path, f"{key}.full.jpg")
+    (set_name, dir_path) = get_set_directory(output_dir, 
+        card['set_name'] if use_set_names else card['set'].upper())
+    return  save_set_card_image(set_name, dir_path, card)
 
+#
+# save_set_card_image(set_name, dir_path, card)
+# download the card image to the directory of its set
+#
+# set_name and dir_path are returned by get_set_directory().  callers which
+# save many cards of a set resolve the directory once for the set.
+#
+# returns  (submitted, not_saved) counts of cards
+#
+def save_set_card_image(set_name, dir_path, card):
     saved_count = 0
     not_saved_count = 0
 
+    # filenames are assigned and submitted by one thread at a time
+    with save_card_image.lock:
+        try:
+            work = plan_card_image(card, set_name, dir_path)
+            if work:
+                futures = [download_file(*item) for item in work]
+        finally:
+            # take the pending downloads of the files to rename
+            renames = [(pending_files.pop(file_path, None), file_path, new_path)
+                       for file_path, new_path in get_pending_renames()]
+            get_pending_renames().clear()
+    # wait for the downloads without holding the lock, so other threads may
+    # assign filenames in the meantime
+    for future, file_path, new_path in renames:
+        if future:
+            # exception() rather than wait(), which is not woken when a
+            # shutdown cancels the download
+            try:
+                future.exception()
+            except CancelledError:
+                continue
+        with save_card_image.lock:
+            rename_file(file_path, new_path)
     # download and store the card images
-    if 'card_faces' in card and len(card['card_faces']) > 0:
-        if 'layout' in card and card['layout'] == 'adventure':
-            # adventure cards have an alternate name: card_faces[0]
-            write_file(card['image_uris']['large'], 
-                      get_filename(card['card_faces'][0]))
-            print(f" saved {set_name}:{card['name']}")
-            saved_count += 1
-        elif 'layout' in card and card['layout'] == 'split':
-            # split cards have an alternate name: face[0] + face[1]
-            write_file(card['image_uris']['large'], 
-get_filename(card['card_faces'][0], card['card_faces'][1]['name']))
-            print(f" saved {set_name}:{card['name']}")
-            saved_count += 1
-        elif 'layout' in card and card['layout'] == 'flip':
-            # flip cards are two images: faces[0], flip(faces[1])
-            file_0 = get_filename(card['card_faces'][0])
-            write_file(card['image_uris']['large'], file_0)
-            image = Image.open(file_0)
-            pixels = image.transpose(Image.Transpose.ROTATE_180)
-            pixels.save(get_filename(card['card_faces'][1]))
-            pixels.close()
-            image.close()
-            print(f" saved {set_name}:{card['name']}")
-            saved_count += 1
-        elif 'layout' in card and card['layout'] == 'reversible_card':
-            # reversibles are not coded in Forge card rules, thus there is no
-            # back loaded for this card.  store the back with -bk postfix.
-            write_file(card['card_faces'][0]['image_uris']['large'],
-                      get_filename(card['card_faces'][0]))
-            write_file(card['card_faces'][1]['image_uris']['large'],
-                      get_filename(card['card_faces'][1], "-bk"))
-            print(f" saved {set_name}:{card['name']}")
-            saved_count += 1
-        else:
-            # transform layout cards have two card images
-            for card_face in card['card_faces']:
-                write_file(card_face['image_uris']['large'], 
-                          get_filename(card_face))
-            print(f" saved {set_name}:{card['name']}")
-            saved_count += 1
-    elif 'image_uris' in card:
-        write_file(card['image_uris']['large'], get_filename(card))
-        print(f" saved {set_name}:{card['name']}")
+    if work:
+        get_pending_cards().append((f"{set_name}:{card['name']}", futures))
         saved_count += 1
     else:
-        print(f"No valid image found for card: {card['name']}")
+        logger.warning("No valid image found for card: %s", card['name'])
         not_saved_count += 1
 
     return saved_count, not_saved_count
 
+# lock : a lock for unique filenames and renaming files in save_card_image()
+save_card_image.lock = threading.Lock()
+
+#
+# parse_line(line)
+# split a line of a list of cards into its parts in one pass
+#
+# an entry of a list of cards: <card_name> [<set>] <card number>  # comment
+#  the set code is enclosed in brackets or parens
+#
+# returns  (entry, name, set, number) or None if the brackets are unbalanced
+#  set and number are None if they are not in the entry
+#
+def parse_line(line):
+    text = line.strip()
+    comment = text.find('#')
+    if comment < 0:
+        comment = len(text)
+    # the set code begins at the first bracket or paren before the comment
+    bracket = text.find('[', 0, comment)
+    paren = text.find('(', 0, bracket if bracket >= 0 else comment)
+    if paren >= 0:
+        bracket = paren
+    if bracket < 0:
+        # only a card name
+        entry = text[:comment].rstrip()
+        return  entry, entry, None, None
+    # the set code ends at the first closing bracket or paren before the
+    # comment
+    close = text.find(']', bracket + 1, comment)
+    close_paren = text.find(')', bracket + 1, close if close >= 0 else comment)
+    if close_paren >= 0:
+        close = close_paren
+    if close <= bracket + 1:
+        return  None  # unbalanced brackets or an empty set code
+    # the card number is the remainder of the entry before the comment
+    rest = text[close + 1:comment].rstrip()
+    return  (text[:close + 1] + rest, text[:bracket].rstrip(), 
+             text[bracket + 1:close], rest.lstrip() or None)
+
+#
+# parse_entry(line)
+# parse an entry of a list of cards
+#
+# returns  (entry, parameters) for get_card_data_and_download()
+#  entry is the line without comments or surrounding whitespace
+#  parameters is None if the entry is invalid, e.g. unbalanced brackets
+#
+def parse_entry(line):
+    parts = parse_line(line)
+    if not parts:
+        return  line.split('#', 1)[0].strip(), None
+    (entry, card_name, set_code, card_number) = parts
+    if not set_code:
+        # only a card name, no set code
+        return  entry, {'name': card_name}
+    # include set code and optionals in query
+    parameters = {'set': set_code}
+    # ignore null card names
+    if card_name:
+        parameters['name'] = card_name
+    # ignore invalid card numbers
+    if card_number and card_number.isalnum():
+        parameters['number'] = card_number
+    return  entry, parameters
+
 #
 # download_cards_list(output_dir, list_name, use_set_names)
 # download card images from a list of card names, sets and card numbers
@@ -389,6 +1398,11 @@ get_filename(card['card_faces'][0], card['card_faces'][1]['name']))
 #  Soldier              Soldiers from all sets
 #  [MOE]                Card set MOE
 #
+# entries are fetched concurrently.  when several entries select prints with
+# the same name in the same set, duplicate names are numbered (Name, Name1,
+# ...) in the order the fetches complete, so which print is saved under
+# which name may differ between runs of the same list.
+#
 def download_cards_list(output_dir, list_name, use_set_names=False):
     try:
         with open(list_name, "r") as file:
@@ -402,50 +1416,140 @@ def download_cards_list(output_dir, list_name, use_set_names=False):
 
     saved_count = 0
     not_saved_count = 0
+    # entries selecting one card by set code and card number
+    collection = []
+    # entries which may select multiple cards
+    searches = []
 
-    # an entry in the list may select multiple cards
-    for entry in card_list:
-        # truncate at comment
-        comment_index = entry.find('#')
-        if comment_index >= 0:
-            entry = entry[:comment_index]
-        entry = entry.strip()  # remove leading and trailing whitespace
+    for line in card_list:
+        (entry, parameters) = parse_entry(line)
         # skip empty lines
-        if len(entry) < 1:
+        if not entry:
+            continue
+        if not parameters:
+            logger.warning("No cards match: %s", entry)
+            not_saved_count += 1
             continue
 
-        # find set code in brackets
-        set_code_match = re.search(r'(\[|\()(.+)(\]|\))', entry)
-
-        if not set_code_match:
-            # only a card name, no set code
-            parameters = {'name': entry}
+        if 'set' in parameters and 'number' in parameters:
+            collection.append((entry, parameters))
         else:
-            # include set code and optionals in query
-            parameters = {'set': set_code_match[2]}
-            card_name = entry[:set_code_match.start()].strip()
-            # ignore null card names
-            if len(card_name) > 0:
-                parameters['name'] = card_name
-            card_number = entry[set_code_match.end()+1:].strip()
-            # ignore invalid card numbers
-            if len(card_number) > 0 and card_number.isalnum():
-                parameters['number'] = card_number
-
-        saved, not_saved = get_card_data_and_download(output_dir, parameters, 
-            use_set_names=use_set_names)
-        saved_count += saved
-        not_saved_count += not_saved
-
-        if saved == 0:
-            if not_saved == 0:
-                print("No cards match:", entry)
-                not_saved_count += 1
-            else: # not_saved > 0:
-                print("Failed to download cards for:", entry)
+            searches.append((entry, parameters))
+
+    # the cards of the list are fetched by up to 8 threads.  each thread
+    # waits for the card images it submitted to the image pool.
+    with ThreadPoolExecutor(max_workers=8, thread_name_prefix='list') \
+            as list_pool:
+        jobs = []
+        # fetch cards selected by set code and card number in batches of 75,
+        # the limit of the collection endpoint
+        for i in range(0, len(collection), 75):
+            jobs.append(list_pool.submit(get_collection_and_download, 
+                output_dir, collection[i:i + 75], use_set_names))
+        # an entry in the list may select multiple cards
+        for entry, parameters in searches:
+            if 'name' not in parameters:
+                jobs.append(list_pool.submit(get_entry_and_download, 
+                    output_dir, entry, parameters, use_set_names))
+        # entries which select cards by name are combined in one query per set
+        for query, entries in get_name_queries(
+                [(entry, parameters) for entry, parameters in searches 
+                 if 'name' in parameters]):
+            jobs.append(list_pool.submit(get_names_and_download, 
+                output_dir, query, entries, use_set_names))
+
+        try:
+            for job in jobs:
+                (saved, not_saved) = job.result()
+                saved_count += saved
+                not_saved_count += not_saved
+        except BaseException:
+            # interrupted, e.g. Ctrl-C.  do not start the queued entries
+            list_pool.shutdown(wait=False, cancel_futures=True)
+            cancel_downloads()
+            raise
 
     return  saved_count, not_saved_count
 
+#
+# get_entry_and_download(output_dir, entry, parameters, use_set_names)
+# download the card images selected by an entry of a list of cards
+#
+# returns  (saved, not_saved) counts of cards
+#
+def get_entry_and_download(output_dir, entry, parameters, use_set_names=False):
+    saved, not_saved = get_card_data_and_download(output_dir, parameters, 
+        use_set_names=use_set_names)
+
+    if saved == 0:
+        if not_saved == 0:
+            logger.warning("No cards match: %s", entry)
+            not_saved += 1
+        else: # not_saved > 0:
+            logger.warning("Failed to download cards for: %s", entry)
+    return  saved, not_saved
+
+#
+# get_names_and_download(output_dir, query, entries, use_set_names)
+# download the card images of a query combining entries of a list of cards
+#
+# see get_name_queries()
+#
+# returns  (saved, not_saved) counts of cards
+#
+def get_names_and_download(output_dir, query, entries, use_set_names=False):
+    found = []
+    saved, not_saved = get_card_data_and_download(output_dir, query, 
+        use_set_names=use_set_names, found=found)
+
+    # match the cards found to the entries of the query
+    found = [name.lower() for name in found]
+    for entry, parameters in entries:
+        name = parameters['name'].lower()
+        if not any(name in found_name for found_name in found):
+            logger.warning("No cards match: %s", entry)
+            not_saved += 1
+        elif saved == 0:
+            logger.warning("Failed to download cards for: %s", entry)
+    return  saved, not_saved
+
+#
+# get_name_queries(entries)
+# combine entries of a list of cards into Scryfall queries by card name
+#
+# entries is a list of (entry, parameters) with a card name and an optional
+# set code.  names in the same set are combined with the or operator:
+#  set:ltr (name:"Mountain" or name:"Island")
+# queries are limited to about max_length characters
+#
+# returns  a list of (query, entries)
+#
+def get_name_queries(entries, max_length=400):
+    # group entries by set code
+    sets = dict()
+    for entry, parameters in entries:
+        set_code = parameters.get('set', '').lower()
+        sets.setdefault(set_code, []).append((entry, parameters))
+
+    queries = []
+    for set_code, group in sets.items():
+        prefix = f"set:{set_code} " if set_code else ''
+        names = []
+        members = []
+        for entry, parameters in group:
+            name = 'name:"{0}"'.format(parameters['name'].replace('"', ''))
+            if name not in names:
+                if names and len(prefix) + len(' or '.join(names)) + \
+                   len(name) + 6 > max_length:
+                    # start a new query
+                    queries.append((f"{prefix}({' or '.join(names)})", members))
+                    names = []
+                    members = []
+                names.append(name)
+            members.append((entry, parameters))
+        queries.append((f"{prefix}({' or '.join(names)})", members))
+    return  queries
+
 #
 # download_set(output_dir, set_code, use_set_names)
 # download card images from a specific Magic: The Gathering set
@@ -467,9 +1571,12 @@ def download_set(output_dir, set_code, use_set_names=False):
 # run unit tests for the downloader
 #
 def unit_test():
-    global write_file
+    global write_file, cache_dir, post_request_limited, skip_existing, \
+           image_format
     # Function to run unit tests for the script
     print("Running unit tests...")
+    # do not cache the images of the unit test
+    cache_dir = None
     # set output directory for unit test
     output_dir = os.path.join(os.getcwd(), "unit-test")
     # create the test directory
@@ -496,6 +1603,10 @@ def unit_test():
     # disable fetch URL in write_file
     write_file_orig = write_file
     write_file = lambda url, file_path: write_file_orig(None, file_path)
+    # save a card image and wait for the downloads to complete
+    def save_card_image_wait(output_dir, card, use_set_names):
+        save_card_image(output_dir, card, use_set_names)
+        return  finish_downloads()
 
     # Test 2.1: save land cards
     card = {
@@ -505,12 +1616,12 @@ def unit_test():
         'image_uris': {'large': 'https://api.scryfall.com/cards/300/large.jpg'}
     }
     # write_file("http://127.0.0.1/image.jpg", os.path.join(output_dir, "image.jpg"))
-    save_card_image(output_dir, card, True)
+    save_card_image_wait(output_dir, card, True)
     if not os.path.isfile(os.path.join(output_dir, card['set_name'], card['name'] + ".full.jpg")):
         print("Test 2.1 failed: save_card_image did not save Mountain")
         errors += 1
     card['name'] = "Island"
-    save_card_image(output_dir, card, True)
+    save_card_image_wait(output_dir, card, True)
     if not os.path.isfile(os.path.join(output_dir, card['set_name'], card['name'] + ".full.jpg")):
         print("Test 2.1 failed: save_card_image did not save Island")
         errors += 1
@@ -522,11 +1633,11 @@ def unit_test():
         'name': "Island",
         'image_uris': {'large': 'https://api.scryfall.com/cards/300/large.jpg'}
     }
-    save_card_image(output_dir, card, True)
+    save_card_image_wait(output_dir, card, True)
     if not os.path.isfile(os.path.join(output_dir, card['set_name'], card['name'] + ".full.jpg")):
         print("Test 2.2 failed: save_card_image did not save Island")
         errors += 1
-    save_card_image(output_dir, card, True)
+    save_card_image_wait(output_dir, card, True)
     if os.path.isfile(os.path.join(output_dir, card['set_name'], card['name'] + ".full.jpg")):
         print("Test 2.2 failed: save_card_image did not rename Island to Island1")
         errors += 1
@@ -536,7 +1647,7 @@ def unit_test():
     if not os.path.isfile(os.path.join(output_dir, card['set_name'], card['name'] + "2.full.jpg")):
         print("Test 2.2 failed: save_card_image did not save Island2")
         errors += 1
-    save_card_image(output_dir, card, True)
+    save_card_image_wait(output_dir, card, True)
     if not os.path.isfile(os.path.join(output_dir, card['set_name'], card['name'] + "3.full.jpg")):
         print("Test 2.2 failed: save_card_image did not save Island3")
         errors += 1
@@ -548,12 +1659,12 @@ def unit_test():
         'name': "Plains",
         'image_uris': {'large': 'https://api.scryfall.com/cards/300/large.jpg'}
     }
-    save_card_image(output_dir, card, True)
+    save_card_image_wait(output_dir, card, True)
     if not os.path.isfile(os.path.join(output_dir, card['set_name'], card['name'] + ".full.jpg")):
         print("Test 2.3.1 failed: save_card_image did not save properly")
         errors += 1
     card['set_name'] = "Unit Test 2.3.2"
-    save_card_image(output_dir, card, True)
+    save_card_image_wait(output_dir, card, True)
     if not os.path.isfile(os.path.join(output_dir, card['set_name'], card['name'] + ".full.jpg")):
         print("Test 2.3.2 failed: save_card_image did not save properly")
         errors += 1
@@ -561,10 +1672,64 @@ def unit_test():
         print("Test 2.3.2 failed: errant renaming of file")
         errors += 1
     card['set_name'] = "Unit Test 2.3.3"
-    save_card_image(output_dir, card, True)
+    save_card_image_wait(output_dir, card, True)
     if not os.path.isfile(os.path.join(output_dir, card['set_name'], card['name'] + ".full.jpg")):
         print("Test 2.3.3 failed: save_card_image did not save properly")
         errors += 1
+
+    # Test 2.4: save duplicate cards while downloads are in progress
+    card = {
+        'set': 'UT2-4',
+        'set_name': "Unit Test 2.4",
+        'name': "Forest",
+        'image_uris': {'large': 'https://api.scryfall.com/cards/300/large.jpg'}
+    }
+    for i in range(3):
+        save_card_image(output_dir, card, True)
+    finish_downloads()
+    if os.path.isfile(os.path.join(output_dir, card['set_name'], card['name'] + ".full.jpg")):
+        print("Test 2.4 failed: save_card_image did not rename Forest to Forest1")
+        errors += 1
+    for i in range(1, 4):
+        if not os.path.isfile(os.path.join(output_dir, card['set_name'], card['name'] + f"{i}.full.jpg")):
+            print(f"Test 2.4 failed: save_card_image did not save Forest{i}")
+            errors += 1
+    # Test 2.5: skip card images saved by a previous run
+    skip_existing = True
+    card = {
+        'set': 'UT2-5',
+        'set_name': "Unit Test 2.5",
+        'name': "Wastes",
+        'image_uris': {'large': 'https://api.scryfall.com/cards/300/large.jpg'}
+    }
+    makedirs(os.path.join(output_dir, card['set_name']))
+    with open(os.path.join(output_dir, card['set_name'], card['name'] + ".full.jpg"), 'wb') as file:
+        file.write(b'jpg')
+    save_card_image_wait(output_dir, card, True)
+    if os.path.getsize(os.path.join(output_dir, card['set_name'], card['name'] + ".full.jpg")) != 3:
+        print("Test 2.5 failed: save_card_image replaced a saved card image")
+        errors += 1
+    skip_existing = False
+    # Test 2.6: remove partial files of an interrupted run
+    dir_path = os.path.join(output_dir, "Unit Test 2.6")
+    makedirs(dir_path)
+    live_path = get_part_path(os.path.join(dir_path, "Bayou.full.jpg"))
+    # the partial file of a process which has exited, modified 2 hours ago
+    exited = subprocess.Popen([sys.executable, '-c', ''])
+    exited.wait()
+    part_path = os.path.join(dir_path, 
+        f".Badlands.full.jpg.{exited.pid}-{threading.get_ident()}.part")
+    for path in (live_path, part_path):
+        with open(path, 'wb') as file:
+            file.write(b'jp')
+    os.utime(part_path, (time.time() - 7200, time.time() - 7200))
+    get_set_directory(output_dir, "Unit Test 2.6")
+    if os.path.isfile(part_path):
+        print("Test 2.6 failed: get_set_directory did not remove " + part_path)
+        errors += 1
+    if not os.path.isfile(live_path):
+        print("Test 2.6 failed: get_set_directory removed " + live_path)
+        errors += 1
     # end of test 2
     if errors == 0:
         print("Test 2 passed")
@@ -581,7 +1746,7 @@ def unit_test():
             {'name': 'Crimson Zombie', 'image_uris': {'large': 'https://api.scryfall.com/cards/300/large_front.jpg'}}
         )
     }
-    save_card_image(output_dir, card, False)
+    save_card_image_wait(output_dir, card, False)
     if not os.path.isfile(os.path.join(output_dir, card['set'], card['card_faces'][0]['name'] + ".full.jpg")):
         print("Test 3.1.1 failed: save_card_image did not save front of transform card")
         errors += 1
@@ -589,7 +1754,7 @@ def unit_test():
         print("Test 3.1.1 failed: save_card_image did not save rear of transform card")
         errors += 1
     # test with duplicate
-    save_card_image(output_dir, card, False)
+    save_card_image_wait(output_dir, card, False)
     if not os.path.isfile(os.path.join(output_dir, card['set'], card['card_faces'][0]['name'] + "2.full.jpg")):
         print("Test 3.1.2 failed: save_card_image did not save front of transform card 2")
         errors += 1
@@ -602,6 +1767,12 @@ def unit_test():
     if not os.path.isfile(os.path.join(output_dir, card['set'], card['card_faces'][1]['name'] + "1.full.jpg")):
         print("Test 3.1.2 failed: save_card_image did not rename rear of transform card 1")
         errors += 1
+    # both faces are downloaded concurrently
+    save_card_image(output_dir, card, False)
+    if len(get_pending_cards()) != 1 or len(get_pending_cards()[0][1]) != 2:
+        print("Test 3.1.3 failed: save_card_image did not submit both faces of transform card")
+        errors += 1
+    finish_downloads()
     # reversible cards
     card = {
         'set': 'UT3',
@@ -613,7 +1784,7 @@ def unit_test():
             {'name': 'Blue Bird', 'image_uris': {'large': 'https://api.scryfall.com/cards/300/large_front.jpg'}}
         )
     }
-    save_card_image(output_dir, card, False)
+    save_card_image_wait(output_dir, card, False)
     if not os.path.isfile(os.path.join(output_dir, card['set'], card['card_faces'][0]['name'] + ".full.jpg")):
         print("Test 3.2 failed: save_card_image did not save front of reversible")
         errors += 1
@@ -632,7 +1803,7 @@ def unit_test():
             {'name': 'Banana Tally'}  #, 'image_uris': {'large': 'https://api.scryfall.com/cards/300/large_front.jpg'}}
         )
     }
-    save_card_image(output_dir, card, False)
+    save_card_image_wait(output_dir, card, False)
     if not os.path.isfile(os.path.join(output_dir, card['set'], 
                                        card['card_faces'][0]['name'] + ".full.jpg")):
         print("Test 3.3 failed: save_card_image did not save adventure card")
@@ -652,7 +1823,7 @@ def unit_test():
             {'name': 'Java'}  #, 'image_uris': {'large': 'https://api.scryfall.com/cards/300/large_front.jpg'}}
         )
     }
-    save_card_image(output_dir, card, False)
+    save_card_image_wait(output_dir, card, False)
     if not os.path.isfile(os.path.join(output_dir, card['set'], 
                                        card['card_faces'][0]['name'] + card['card_faces'][1]['name'] + ".full.jpg")):
         print("Test 3.4 failed: save_card_image did not save adventure card")
@@ -701,6 +1872,152 @@ def unit_test():
     if errors == 0:
         print("Test 5 passed")
 
+    # Test 6: combine card names in queries
+    errors = 0
+    entries = [
+        ("Soldier", {'name': "Soldier"}),
+        ("Island (ltr)", {'set': 'ltr', 'name': "Island"}),
+        ("Force of Will", {'name': "Force of Will"}),
+        ("Forest [LTR]", {'set': 'LTR', 'name': "Forest"})
+    ]
+    result = [query for query, group in get_name_queries(entries)]
+    expected = ['(name:"Soldier" or name:"Force of Will")', 
+                'set:ltr (name:"Island" or name:"Forest")']
+    if result != expected:
+        print('Test 6.1 failed: get_name_queries returned {0}'.format(result))
+        errors += 1
+    entries = [(str(i), {'name': f"Card {i}"}) for i in range(100)]
+    queries = get_name_queries(entries, max_length=100)
+    if any(len(query) > 100 for query, group in queries) or \
+       sum(len(group) for query, group in queries) != 100:
+        print('Test 6.2 failed: get_name_queries did not split long queries')
+        errors += 1
+    # end of test 6
+    if errors == 0:
+        print("Test 6 passed")
+
+    # Test 7: parse entries of a list of cards
+    errors = 0
+    entries = {
+        "Mountain [ltr] 300  # comment\n": 
+            ("Mountain [ltr] 300", {'name': "Mountain", 'set': 'ltr', 'number': '300'}),
+        "Force of Will (ALL)\n": 
+            ("Force of Will (ALL)", {'name': "Force of Will", 'set': 'ALL'}),
+        "  Soldier  \n": ("Soldier", {'name': "Soldier"}),
+        "[MOE]\n": ("[MOE]", {'set': 'MOE'}),
+        "[ALL]17\n": ("[ALL]17", {'set': 'ALL', 'number': '17'}),
+        "Plains [c13] 300 foo\n": ("Plains [c13] 300 foo", {'name': "Plains", 'set': 'c13'}),
+        "# Elven Wars deck 1.4\n": ("", {'name': ""}),
+        "\n": ("", {'name': ""}),
+        "Plains [c13\n": ("Plains [c13", None),
+        "Plains [c13 # 300]\n": ("Plains [c13", None),
+        "Plains (c13 # 300)\n": ("Plains (c13", None)
+    }
+    for line, expected in entries.items():
+        result = parse_entry(line)
+        if result != expected:
+            print('Test 7 failed: parse_entry({0!r}) returned {1}'.format(line, result))
+            errors += 1
+    # end of test 7
+    if errors == 0:
+        print("Test 7 passed")
+
+    # Test 8: fetch a batch of cards from the collection endpoint
+    errors = 0
+    requests_sent = []
+    class CollectionResponse:
+        status_code = 200
+        reason = 'OK'
+        def __init__(self, cards):
+            self.content = orjson.dumps({'data': cards})
+    collection = [
+        {'set': 'ut8', 'set_name': "Unit Test 8", 'name': "Swamp",
+         'collector_number': '300', 
+         'image_uris': {'large': 'https://api.scryfall.com/cards/300/large.jpg'}},
+        {'set': 'ut8', 'set_name': "Unit Test 8", 'name': "Swamp",
+         'collector_number': '301', 
+         'image_uris': {'large': 'https://api.scryfall.com/cards/301/large.jpg'}}
+    ]
+    post_request_limited_orig = post_request_limited
+    post_request_limited = lambda *args, **kwargs: \
+        requests_sent.append(kwargs['data']) or CollectionResponse(collection)
+    entries = [
+        ("Swamp [UT8] 300", {'name': "Swamp", 'set': 'UT8', 'number': '300'}),
+        ("Swamp [UT8] 301", {'name': "Swamp", 'set': 'UT8', 'number': '301'}),
+        ("Island [UT8] 302", {'name': "Island", 'set': 'UT8', 'number': '302'})
+    ]
+    result = get_collection_and_download(output_dir, entries)
+    if len(requests_sent) != 1:
+        print("Test 8.1 failed: {0} requests sent".format(len(requests_sent)))
+        errors += 1
+    if result != (2, 1):
+        print("Test 8.2 failed: get_collection_and_download returned {0}".format(result))
+        errors += 1
+    for i in range(1, 3):
+        if not os.path.isfile(os.path.join(output_dir, 'UT8', f"Swamp{i}.full.jpg")):
+            print(f"Test 8.3 failed: get_collection_and_download did not save Swamp{i}")
+            errors += 1
+    # Test 8.4: match duplicate identifiers by name
+    collection = [
+        {'set': 'ut8', 'set_name': "Unit Test 8", 'name': "Plains",
+         'collector_number': '339', 
+         'image_uris': {'large': 'https://api.scryfall.com/cards/339/large.jpg'}}
+    ]
+    entries = [
+        ("Plainz [UT8] 339", {'name': "Plainz", 'set': 'UT8', 'number': '339'}),
+        ("Plains [UT8] 339", {'name': "Plains", 'set': 'UT8', 'number': '339'})
+    ]
+    result = get_collection_and_download(output_dir, entries)
+    if result != (1, 1):
+        print("Test 8.4 failed: get_collection_and_download returned {0}".format(result))
+        errors += 1
+    if not os.path.isfile(os.path.join(output_dir, 'UT8', "Plains.full.jpg")):
+        print("Test 8.4 failed: get_collection_and_download did not save Plains")
+        errors += 1
+    post_request_limited = post_request_limited_orig
+    # end of test 8
+    if errors == 0:
+        print("Test 8 passed")
+
+    # Test 9: rotate and convert card images
+    errors = 0
+    # a 4:2:0 JPEG with partial MCU blocks at the edges, as Scryfall's
+    # 672x936 images.  the top left corner is red
+    image = Image.new('RGB', (40, 56), (255, 255, 255))
+    image.paste((255, 0, 0), (0, 0, 16, 16))
+    dir_path = os.path.join(output_dir, "Unit Test 9")
+    makedirs(dir_path)
+    jpeg_path = os.path.join(dir_path, "Plains.full.jpg")
+    image.save(jpeg_path, 'JPEG', quality=95, subsampling=2)
+    # Test 9.1: rotate a JPEG image 180 degrees
+    flip_path = os.path.join(dir_path, "Plains.flip.jpg")
+    rotate_image(jpeg_path, flip_path)
+    with Image.open(flip_path) as flipped:
+        if flipped.size != image.size:
+            print("Test 9.1 failed: rotate_image returned size {0}".format(flipped.size))
+            errors += 1
+        elif flipped.getpixel((36, 52))[1] > 64 or flipped.getpixel((3, 3))[1] < 192:
+            print("Test 9.1 failed: rotate_image did not rotate the image")
+            errors += 1
+    # Test 9.2: convert downloads to webp
+    write_file = lambda url, file_path: shutil.copyfile(jpeg_path, file_path)
+    image_format = 'webp'
+    file_path = os.path.join(dir_path, "Island.full.webp")
+    flip_path = os.path.join(dir_path, "Island.flip.webp")
+    save_file('https://api.scryfall.com/cards/ut9/large.jpg', file_path, flip_path)
+    image_format = 'jpg'
+    for path in (file_path, flip_path):
+        with Image.open(path) as converted:
+            if converted.format != 'WEBP' or converted.size != image.size:
+                print("Test 9.2 failed: save_file saved {0} {1}".format(converted.format, converted.size))
+                errors += 1
+    if any(name.endswith('.part') for name in os.listdir(dir_path)):
+        print("Test 9.2 failed: save_file left a partial file")
+        errors += 1
+    # end of test 9
+    if errors == 0:
+        print("Test 9 passed")
+
     print("Unit test complete")
 
 # begin main script
@@ -708,11 +2025,21 @@ if __name__ == "__main__":
     # optionally run unit tests
     testing = False
     if testing:
+        start_logging()
         unit_test()
         exit(0)  # Exit after running unit tests
 
     # parse command line arguments
     args = arg_parser.parse_args()
+    log_listener = start_logging(logging.WARNING if args.quiet 
+                                 else logging.INFO)
+    if args.no_cache:
+        cache_dir = None
+    elif args.cache_directory:
+        cache_dir = os.path.abspath(args.cache_directory)
+    durable = args.durable
+    skip_existing = args.skip_existing
+    image_format = args.format
     
     # write card images to an output directory
     output_directory = args.output_directory
@@ -762,6 +2089,7 @@ Select: ")
         exit(0)
 
     end = datetime.datetime.now()
+    log_listener.stop()  # write the remaining log records
     print(f"\nTotal cards saved:     {saved}")
     print(f"Total cards not saved: {not_saved}")
 